@@ -4,24 +4,17 @@ Optimized Backup UI for Linux, tested on Ubuntu with PySide6
 """
 
 import sys
-import os
-import json
 import logging
 from pathlib import Path
-from fnmatch import fnmatch
+from collections import deque
 from dataclasses import dataclass, field
 from typing import List
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from PySide6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QTextEdit,
                                QProgressBar, QPushButton, QListWidget, QFileDialog, QMessageBox)
-from PySide6.QtCore import QThread, Signal, QObject, Qt, QTimer
+from PySide6.QtCore import QThread, Signal, Qt, QTimer
 
-try:
-    from send2trash import send2trash
-except ImportError:
-    send2trash = None
+from sync_core import SyncEngine, json_dumps, json_loads
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 CONFIG_DIR = SCRIPT_DIR
@@ -42,51 +35,45 @@ class BackupConfig:
     sources: List[str] = field(default_factory=list)
     excludes: List[str] = field(default_factory=list)
     destination: str = ""
+    quick_check: bool = True
+    reflink: bool = False
 
     def filename(self):
         safe = self.name.replace(' ', '_')
         return CONFIG_DIR / f'{safe}.json'
 
     def save(self):
-        data = {'name': self.name, 'sources': self.sources, 'excludes': self.excludes, 'destination': self.destination}
-        with open(self.filename(), 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        data = {'name': self.name, 'sources': self.sources, 'excludes': self.excludes, 'destination': self.destination,
+                'quick_check': self.quick_check, 'reflink': self.reflink}
+        self.filename().write_bytes(json_dumps(data, indent=True))
         logger.info(f"Saved config {self.filename()}")
 
     @staticmethod
     def load(path: Path):
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = json_loads(path.read_bytes())
         return BackupConfig(
             name=data.get('name', path.stem),
             sources=data.get('sources', []),
             excludes=data.get('excludes', []),
-            destination=data.get('destination', '')
+            destination=data.get('destination', ''),
+            quick_check=data.get('quick_check', True),
+            reflink=data.get('reflink', False)
         )
 
-class QtLogHandler(logging.Handler, QObject):
-    new_record = Signal(str)
-    def __init__(self):
+class QtLogHandler(logging.Handler):
+    """Buffers formatted records; the UI drains them on a timer instead of one signal per record."""
+    def __init__(self, maxlen=5000):
         logging.Handler.__init__(self)
-        QObject.__init__(self)
+        self._buf = deque(maxlen=maxlen)
     def emit(self, record):
-        msg = self.format(record)
-        self.new_record.emit(msg)
-
-def files_identical(path1: Path, path2: Path, chunk_size=65536) -> bool:
-    if not path1.exists() or not path2.exists():
-        return False
-    if path1.stat().st_size != path2.stat().st_size:
-        return False
-    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        self._buf.append(self.format(record))
+    def drain(self):
+        msgs = []
         while True:
-            b1 = f1.read(chunk_size)
-            b2 = f2.read(chunk_size)
-            if b1 != b2:
-                return False
-            if not b1:
-                break
-    return True
+            try:
+                msgs.append(self._buf.popleft())
+            except IndexError:
+                return msgs
 
 class SyncWorker(QThread):
     progress = Signal(int)
@@ -97,173 +84,24 @@ class SyncWorker(QThread):
 
     def __init__(self, config: BackupConfig, destination_override: str | None = None):
         super().__init__()
-        self.config = config
-        self.destination_override = destination_override
-        self._stop = False
-        self.max_threads = 4
+        self.engine = SyncEngine(config.sources, config.excludes, destination_override or config.destination,
+                                 quick_check=config.quick_check, reflink=config.reflink,
+                                 on_status=self.status.emit, on_progress=self.progress.emit,
+                                 on_scanning_started=self.scanning_started.emit,
+                                 on_scanning_finished=self.scanning_finished.emit)
 
     def stop(self):
-        self._stop = True
+        self.engine.stop()
 
     def run(self):
         try:
-            self._sync()
+            self.engine.sync()
         except Exception as e:
             logger.exception('Sync failed')
             self.status.emit(f'Error: {e}')
         finally:
             self.finished_sig.emit()
 
-    def _is_excluded(self, abs_path: Path) -> bool:
-        s = str(abs_path.absolute())
-        for pat in self.config.excludes:
-            if fnmatch(s, pat):
-                return True
-        return False
-    
-    def _copy_file(self, src_file: Path, dest_file: Path):
-        if src_file.is_symlink():
-            target = os.readlink(src_file)
-            if dest_file.exists():
-                # existing Symlink
-                if dest_file.is_symlink():
-                    existing_target = os.readlink(dest_file)
-                    if existing_target == target:
-                        self.status.emit(f"Symlink unchanged: {src_file}")
-                        return
-                # exists but wrong destination -> remove
-                try:
-                    if dest_file.is_dir() and not dest_file.is_symlink():
-                        shutil.rmtree(dest_file)
-                        msg = f"Directory deleted: {dest_file}"
-                        logger.info(msg)
-                        self.status.emit(msg)
-                    else:
-                        dest_file.unlink()
-                except Exception as e:
-                    logger.warning(f"Failed to remove existing file for symlink {dest_file}: {e}")
-
-            try:
-                os.symlink(target, dest_file)
-                msg = f"Symlink created: {src_file} -> {target}"
-                logger.info(msg)
-                self.status.emit(msg)
-            except FileExistsError:
-                # If target got created during Process -> ignore
-                self.status.emit(f"Symlink already exists (ignored): {dest_file}")
-            except Exception as e:
-                logger.warning(f"Failed to copy symlink {src_file}: {e}")
-            return
-
-        # Normal Files
-        if dest_file.exists() and files_identical(src_file, dest_file):
-            self.status.emit(f"Skipping (identical): {src_file.name}")
-            return
-
-        dest_file.parent.mkdir(parents=True, exist_ok=True)
-        try:
-            with open(src_file, 'rb') as fsrc, open(dest_file, 'wb') as fdst:
-                shutil.copyfileobj(fsrc, fdst, length=1024*1024)
-            shutil.copystat(src_file, dest_file, follow_symlinks=False)
-            msg = f"Copied: {src_file} -> {dest_file}"
-            logger.info(msg)
-            self.status.emit(msg)
-        except Exception as e:
-            logger.warning(f"Failed to copy {src_file}: {e}")
-
-    def _sync(self):
-        dest_root = Path(self.destination_override or self.config.destination)
-        if not dest_root:
-            self.status.emit('No destination set.')
-            return
-            
-        self.scanning_started.emit()
-        
-        file_map = []
-        total_bytes = 0
-        for src in self.config.sources:
-            srcp = Path(src)
-            if not srcp.exists():
-                logger.warning(f'Source does not exist: {src}')
-                continue
-            for root, dirs, files in os.walk(srcp, followlinks=False):
-                for f in files:
-                    fp = Path(root) / f  # absolute Path
-                    if self._is_excluded(fp):
-                        continue
-                    rel_path = Path(root).relative_to(srcp) / f
-                    file_map.append((fp, rel_path, srcp.name))
-                    try:
-                        total_bytes += fp.stat().st_size
-                    except FileNotFoundError:
-                        continue
-                        
-        self.scanning_finished.emit()                
-
-        copied_bytes = 0
-        # Parallel Working with limited Threads
-        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-            futures = {}
-            for src_file, rel_path, src_base in file_map:
-                if self._stop:
-                    self.status.emit('Stopped by user')
-                    break
-                dest_file = dest_root / src_base / rel_path
-                futures[executor.submit(self._copy_file, src_file, dest_file)] = src_file
-            for future in as_completed(futures):
-                src_file = futures[future]
-                try:
-                    future.result()
-                    copied_bytes += src_file.stat().st_size
-                except FileNotFoundError:
-                    continue
-                percent = int(copied_bytes / total_bytes * 100) if total_bytes else 100
-                self.progress.emit(percent)
-
-        # Removal of Files and Folders that no longer exist in the Orginal Filesystem
-        for src in self.config.sources:
-            srcp = Path(src)
-            backup_root = dest_root / srcp.name
-            if not backup_root.exists():
-                continue
-            for root, dirs, files in os.walk(backup_root, topdown=False):
-                root_path = Path(root)
-
-                # Files
-                for f in files:
-                    backup_file = root_path / f
-                    rel = backup_file.relative_to(backup_root)
-                    orig_file = srcp / rel
-                    if not orig_file.exists():
-                        try:
-                            if send2trash:
-                                send2trash(str(backup_file))
-                                msg = f"Deleted to trash: {backup_file}"
-                            else:
-                                backup_file.unlink()
-                                msg = f"Deleted: {backup_file}"
-                            logger.info(msg)
-                            self.status.emit(msg)
-                        except FileNotFoundError:
-                            continue
-
-                # Folders
-                for d in dirs:
-                    backup_dir = root_path / d
-                    rel = backup_dir.relative_to(backup_root)
-                    orig_dir = srcp / rel
-                    if not orig_dir.exists():
-                        try:
-                            shutil.rmtree(backup_dir)
-                            msg = f"Deleted folder: {backup_dir}"
-                            logger.info(msg)
-                            self.status.emit(msg)
-                        except Exception as e:
-                            logger.warning(f"Failed to delete folder {backup_dir}: {e}")
-
-        self.status.emit('Sync completed')
-        self.progress.emit(100)
-        
 class ScanningPopup(QWidget):
     def __init__(self):
         super().__init__()
@@ -336,9 +174,13 @@ class BackupUI(QWidget):
 
         self.log_handler = QtLogHandler()
         self.log_handler.setFormatter(formatter)
-        self.log_handler.new_record.connect(self.append_log)
         logger.addHandler(self.log_handler)
 
+        # flush buffered log lines 10 times per second
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(100)
+
     def load_configs(self):
         configs = []
         for file in CONFIG_DIR.glob('*.json'):
@@ -351,6 +193,11 @@ class BackupUI(QWidget):
             return
         self.current_config = self.configs[index]
 
+    def flush_log(self):
+        msgs = self.log_handler.drain()
+        if msgs:
+            self.append_log('\n'.join(msgs))
+
     def append_log(self, msg):
         self.log_text.append(msg)
         self.log_text.verticalScrollBar().setValue(self.log_text.verticalScrollBar().maximum())
@@ -0,0 +1,943 @@
+"""
+Sync engine of the backup utility.
+
+Kept free of Qt so it can be compiled with mypyc (``mypyc sync_core.py``);
+Backup.py imports the compiled module automatically when it is present.
+"""
+
+import os
+import sys
+import json
+import errno
+import fcntl
+import hashlib
+import logging
+import mmap
+import queue
+import re
+import shutil
+import stat
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+from itertools import chain, compress
+from operator import itemgetter, not_
+from pathlib import Path
+from typing import Any, Callable
+
+try:
+    from send2trash import send2trash  # type: ignore
+except ImportError:
+    send2trash = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    from blake3 import blake3 as new_hash
+except ImportError:
+    new_hash = hashlib.blake2b  # type: ignore
+
+try:
+    from fastcdc import fastcdc  # type: ignore
+except ImportError:
+    fastcdc = None
+
+try:
+    import liburing  # type: ignore
+except ImportError:
+    liburing = None
+
+INDEX_NAME = '.pybackup-index.json'
+
+# Files above DELTA_THRESHOLD are split with FastCDC and only changed chunks get rewritten
+DELTA_THRESHOLD = 32 * 1024 * 1024
+CHUNK_MIN, CHUNK_AVG, CHUNK_MAX = 16384, 65536, 262144
+
+# Files up to URING_MAX_SIZE are copied through io_uring, URING_BATCH files per submission
+URING_BATCH = 32
+URING_MAX_SIZE = 1024 * 1024
+
+# status and progress signals are sent at most once per STATUS_INTERVAL seconds
+STATUS_INTERVAL = 0.05
+
+# threads used to unlink files that were removed from the sources
+DELETE_THREADS = 8
+
+# scanned entries are checked against the excludes in batches of this size
+SCAN_BATCH = 10000
+
+# scanned files waiting for a copy worker; the scan blocks while the queue is full
+WORK_QUEUE_SIZE = 4096
+
+# size of the per-thread buffer used for hashing and the read/write copy fallback
+COPY_BUFFER_SIZE = 1 << 20
+
+logger = logging.getLogger("backup_ui")
+
+def json_loads(raw: bytes):
+    if orjson:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # orjson rejects lone surrogates (undecodable file names), json does not
+    return json.loads(raw)
+
+def json_dumps(data, indent=False) -> bytes:
+    if orjson:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            pass
+    return json.dumps(data, indent=2 if indent else None).encode('utf-8')
+
+def files_identical(path1: Path, path2: Path, chunk_size=16 << 20, h=None) -> bool:
+    """Compare two files byte by byte; h, if given, is updated with the data of path1 on the way."""
+    if not path1.exists() or not path2.exists():
+        return False
+    size = path1.stat().st_size
+    if size != path2.stat().st_size:
+        return False
+    if size == 0:
+        return True
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2, \
+            mmap.mmap(f1.fileno(), 0, prot=mmap.PROT_READ) as m1, \
+            mmap.mmap(f2.fileno(), 0, prot=mmap.PROT_READ) as m2:
+        if len(m1) != len(m2):
+            return False
+        for m in (m1, m2):
+            if hasattr(m, 'madvise'):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+                m.madvise(mmap.MADV_WILLNEED)
+        # bytes equality is a memcmp; slicing keeps huge files from being copied at once
+        for i in range(0, len(m1), chunk_size):
+            chunk = m1[i:i + chunk_size]
+            if chunk != m2[i:i + chunk_size]:
+                return False
+            if h is not None:
+                h.update(chunk)
+    return True
+
+def file_digest(path: Path, buf: memoryview | None = None) -> str:
+    # BLAKE3 if installed, otherwise BLAKE2b from the stdlib
+    h = new_hash()
+    if buf is None:
+        buf = memoryview(bytearray(COPY_BUFFER_SIZE))
+    # unbuffered, readinto fills buf directly
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(buf[:n])
+    return h.hexdigest()
+
+def _chunks(path: Path):
+    return fastcdc(str(path), CHUNK_MIN, CHUNK_AVG, CHUNK_MAX, fat=True, hf=new_hash)
+
+def chunk_file(path: Path):
+    """Return (digest, [(offset, chunk_hash), ...]) of a file in one read."""
+    h = new_hash()
+    chunks = []
+    for c in _chunks(path):
+        h.update(c.data)
+        chunks.append((c.offset, c.hash))
+    return h.hexdigest(), chunks
+
+def chunk_and_sync(src: Path, dest: Path, known=None):
+    """Rewrite only the chunks of dest that differ from src.
+
+    known is the chunk list of dest from the index; dest is chunked when it is missing.
+    Returns (digest, chunks, written_chunks).
+    """
+    old = dict(known) if known is not None else dict(chunk_file(dest)[1])
+    h = new_hash()
+    chunks = []
+    written = 0
+    size = 0
+    fd = os.open(dest, os.O_RDWR)
+    try:
+        for c in _chunks(src):
+            h.update(c.data)
+            chunks.append((c.offset, c.hash))
+            size = c.offset + c.length
+            if old.get(c.offset) != c.hash:
+                view = memoryview(c.data)
+                pos = c.offset
+                while view:
+                    n = os.pwrite(fd, view, pos)
+                    view = view[n:]
+                    pos += n
+                written += 1
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    return h.hexdigest(), chunks, written
+
+# errors meaning "not supported here", after which the next copy method is tried
+_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY}
+
+# permission bits of files created with mode 0o666
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+def copy_fd(src_fd: int, dst_fd: int, size: int, reflink=False, buf: memoryview | None = None):
+    """Copy src_fd to dst_fd, keeping the data in the kernel where possible.
+
+    With reflink, first tries to clone the file (FICLONE, btrfs/XFS on the same
+    filesystem). Then tries copy_file_range (server-side copy), then sendfile,
+    then a plain read/write loop through buf. Without reflink, copy_file_range is
+    skipped within one filesystem, where btrfs/XFS would clone instead of copying.
+    """
+    if reflink:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+
+    # every method runs until EOF, the size from stat is only a hint. A size of 0 is what
+    # procfs/sysfs report, and copy_file_range copies nothing there, so those go to the read loop
+    copied = 0
+    if size and hasattr(os, 'copy_file_range') and (reflink or os.fstat(src_fd).st_dev != os.fstat(dst_fd).st_dev):
+        try:
+            while True:
+                n = os.copy_file_range(src_fd, dst_fd, 1 << 30)
+                if not n:
+                    break
+                copied += n
+            if copied:
+                return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+
+    if size:
+        try:
+            while True:
+                n = os.sendfile(dst_fd, src_fd, None, 1 << 30)
+                if not n:
+                    break
+                copied += n
+            if copied:
+                return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+
+    if buf is None:
+        buf = memoryview(bytearray(COPY_BUFFER_SIZE))
+    while True:
+        n = os.readv(src_fd, [buf])
+        if not n:
+            break
+        view = buf[:n]
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+def _pread_full(fd: int, buf: memoryview, pos: int) -> int:
+    # fill buf from offset pos on; returns the bytes in buf, less than len(buf) only at EOF
+    while pos < len(buf):
+        n = os.preadv(fd, [buf[pos:]], pos)
+        if not n:
+            break
+        pos += n
+    return pos
+
+def uring_supported() -> bool:
+    # IORING_OP_OPENAT/CLOSE need Linux 5.6
+    if liburing is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        major, minor = (int(x) for x in os.uname().release.split('.')[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= (5, 6)
+
+class UringCopier:
+    """Copies batches of small files through a single io_uring.
+
+    A batch of files costs one io_uring_enter per stage (open, read, write,
+    close) instead of half a dozen syscalls per file. Not thread-safe: use
+    one instance per thread.
+    """
+    def __init__(self, entries=2 * URING_BATCH):
+        self.ring = liburing.Ring()
+        self.cqe = liburing.Cqe()
+        liburing.io_uring_queue_init(entries, self.ring)
+        # one buffer per job of a batch, reused by every batch of this ring
+        self.pool = [memoryview(bytearray(URING_MAX_SIZE)) for _ in range(URING_BATCH)]
+
+    def close(self):
+        liburing.io_uring_queue_exit(self.ring)
+
+    def _run(self, ops):
+        # submit [(prep, *args), ...] at once and return the results in order (int or OSError)
+        results = [None] * len(ops)
+        if not ops:
+            return results
+        for i, (prep, *args) in enumerate(ops):
+            sqe = liburing.io_uring_get_sqe(self.ring)
+            prep(sqe, *args)
+            sqe.user_data = i
+        liburing.io_uring_submit_and_wait(self.ring, len(ops))
+        for _ in ops:
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            cqe = self.cqe[0]
+            i = cqe.user_data
+            try:
+                results[i] = cqe.res
+            except OSError as e:
+                results[i] = e
+            liburing.io_uring_cqe_seen(self.ring, cqe)
+        return results
+
+    def copy_batch(self, jobs: list) -> list:
+        """Copy [(src, dest, size), ...]; returns the digest of the copied data or the error for every job.
+
+        Takes at most URING_BATCH jobs of up to URING_MAX_SIZE bytes.
+        """
+        if len(jobs) > len(self.pool) or any(size > URING_MAX_SIZE for _, _, size in jobs):
+            raise ValueError('batch does not fit the io_uring buffers')
+        # sources are opened first, so a missing source never truncates its backup
+        src_fds = self._run([(liburing.io_uring_prep_open, str(src), os.O_RDONLY | os.O_CLOEXEC)
+                             for src, _, _ in jobs])
+        errors: list = [fd if isinstance(fd, OSError) else None for fd in src_fds]
+        opened = [i for i in range(len(jobs)) if errors[i] is None]
+        dst_fds: list = [None] * len(jobs)
+        res = self._run([(liburing.io_uring_prep_open, str(jobs[i][1]),
+                          os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o666) for i in opened])
+        for i, fd in zip(opened, res):
+            dst_fds[i] = fd
+            if isinstance(fd, OSError):
+                errors[i] = fd
+        pairs = list(zip(src_fds, dst_fds))
+
+        try:
+            live = [i for i, (_, _, size) in enumerate(jobs) if errors[i] is None and size]
+            bufs = {i: self.pool[i][:jobs[i][2]] for i in live}
+            # liburing takes memoryview slices only through an Iovec, which must outlive the submission
+            iovs = [liburing.Iovec([bufs[i]]) for i in live]
+            res = self._run([(liburing.io_uring_prep_readv, pairs[i][0], iov, 0) for i, iov in zip(live, iovs)])
+            for i, n in zip(live, res):
+                if isinstance(n, OSError):
+                    errors[i] = n
+                elif n < len(bufs[i]):
+                    # short read (FUSE, NFS), finish it synchronously; stop early only at EOF
+                    try:
+                        n = _pread_full(pairs[i][0], bufs[i], n)
+                    except OSError as e:
+                        errors[i] = e
+                        continue
+                    if n < len(bufs[i]):
+                        # file shrank since it was scanned
+                        bufs[i] = bufs[i][:n]
+
+            live = [i for i in live if errors[i] is None and bufs[i]]
+            iovs = [liburing.Iovec([bufs[i]]) for i in live]
+            res = self._run([(liburing.io_uring_prep_writev, pairs[i][1], iov, 0) for i, iov in zip(live, iovs)])
+            for i, n in zip(live, res):
+                if isinstance(n, OSError):
+                    errors[i] = n
+                elif n < len(bufs[i]):
+                    # short write, finish it synchronously
+                    view = bufs[i][n:]
+                    try:
+                        while view:
+                            w = os.pwrite(pairs[i][1], view, n)
+                            view = view[w:]
+                            n += w
+                    except OSError as e:
+                        errors[i] = e
+        finally:
+            self._run([(liburing.io_uring_prep_close, fd)
+                       for pair in pairs for fd in pair if isinstance(fd, int)])
+        # empty files have no buffer
+        return [err or new_hash(bufs.get(i, b'')).hexdigest() for i, err in enumerate(errors)]
+
+def apply_stat(dest: Path, st: os.stat_result, dest_mode: int | None = None):
+    """Give dest the times, permissions (and, as root, owner) from st.
+
+    Replaces shutil.copystat: dest_mode is the current mode of dest when known,
+    so chmod is skipped when it already matches. Extended attributes are not copied.
+    """
+    if os.geteuid() == 0:
+        os.chown(dest, st.st_uid, st.st_gid, follow_symlinks=False)
+        dest_mode = None  # chown may clear setuid/setgid bits
+    mode = stat.S_IMODE(st.st_mode)
+    if dest_mode is None or stat.S_IMODE(dest_mode) != mode:
+        os.chmod(dest, mode)
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+class HashIndex:
+    """Persistent {rel_path: (size, mtime_ns, digest[, chunks])} map kept in the backup root."""
+    def __init__(self, root: Path):
+        self.path = root / INDEX_NAME
+        self.entries: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            self.entries = {k: tuple(v) for k, v in json_loads(self.path.read_bytes()).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable index {self.path}: {e}")
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, size: int, mtime_ns: int, digest: str | None, chunks=None):
+        entry = (size, mtime_ns, digest) if chunks is None else (size, mtime_ns, digest, chunks)
+        with self._lock:
+            self.entries[key] = entry
+
+    def prune(self, keys, bases):
+        # drop entries for files that are no longer part of the backup. Only keys under
+        # bases are touched: other configs may back up into the same destination
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items()
+                            if k in keys or k.partition('/')[0] not in bases}
+
+    def save(self):
+        with self._lock:
+            data = dict(self.entries)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(json_dumps(data))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save index {self.path}: {e}")
+
+def walk_files(root: str, exclude: re.Pattern | None = None):
+    """Yield (path, rel_path, stat) for every non-directory below root.
+
+    Same traversal as os.walk(root, followlinks=False), built on os.scandir with
+    an explicit stack; stat is the entry's lstat, or None when that fails.
+    Directories whose path matches exclude are not descended into.
+    """
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    stack = [root]
+    while stack:
+        top = stack.pop()
+        try:
+            it = os.scandir(top)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    # symlinked directories are neither descended into nor copied
+                    if not entry.is_symlink() and not (exclude and exclude.match(entry.path)):
+                        stack.append(entry.path)
+                    continue
+                try:
+                    # lstat data: the size of what is actually backed up, links included
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    st = None
+                yield entry.path, entry.path[len(prefix):], st
+
+class FileTable:
+    """Scanned files stored column-wise.
+
+    Paths live in one bytes blob (the relative path is the tail of the absolute
+    one) next to compact arrays, instead of a tuple of Python objects per file.
+    """
+    def __init__(self):
+        self.bases = []
+        self.base_id = array('H')
+        self.blob = bytearray()
+        self.path_off = array('Q')
+        self.path_len = array('I')
+        self.rel_len = array('I')
+        self.sizes = array('q')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def _base_id(self, base: str) -> int:
+        try:
+            return self.bases.index(base)
+        except ValueError:
+            self.bases.append(base)
+            return len(self.bases) - 1
+
+    def add(self, path: str, rel_path: str, base: str, size: int):
+        raw = os.fsencode(path)
+        self.base_id.append(self._base_id(base))
+        self.path_off.append(len(self.blob))
+        self.path_len.append(len(raw))
+        self.rel_len.append(len(os.fsencode(rel_path)))
+        self.sizes.append(size)
+        self.blob += raw
+
+    def row(self, i: int):
+        """Return (path, rel_path, base) of file i."""
+        off = self.path_off[i]
+        raw = bytes(self.blob[off:off + self.path_len[i]])
+        rel = raw[len(raw) - self.rel_len[i]:]
+        return os.fsdecode(raw), os.fsdecode(rel), self.bases[self.base_id[i]]
+
+    def keys(self):
+        for i in range(len(self)):
+            _, rel, base = self.row(i)
+            yield f"{base}/{rel}"
+
+def compile_excludes(patterns) -> re.Pattern:
+    """Combine glob patterns into one regex; matches nothing when there are none."""
+    if not patterns:
+        return re.compile(r'(?!)')
+    return re.compile('|'.join(f'(?:{translate(p)})' for p in patterns))
+
+def _ignore(*args: Any) -> None:
+    pass
+
+class SyncEngine:
+    """Mirrors the sources into destination/<source name>, reporting through callbacks."""
+    def __init__(self, sources: list[str], excludes: list[str], destination: str,
+                 quick_check: bool = True, reflink: bool = False, max_threads: int = 4,
+                 on_status: Callable[[str], Any] = _ignore,
+                 on_progress: Callable[[int], Any] = _ignore,
+                 on_scanning_started: Callable[[], Any] = _ignore,
+                 on_scanning_finished: Callable[[], Any] = _ignore):
+        self.sources = sources
+        self.destination = destination
+        self.quick_check = quick_check
+        self.reflink = reflink
+        self.max_threads = max_threads
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_scanning_started = on_scanning_started
+        self.on_scanning_finished = on_scanning_finished
+        self._stop = False
+        self.index = HashIndex(Path(destination))
+        self._exclude_re = compile_excludes(excludes)
+        self._last_emit = 0.0
+        self._emit_lock = threading.Lock()
+        self._tls = threading.local()
+        self._scanned_bytes = 0
+        self._scan_lock = threading.Lock()
+
+    def stop(self):
+        self._stop = True
+
+    def _buffer(self) -> memoryview:
+        # one read buffer per worker thread, reused for every file it hashes or copies
+        buf = getattr(self._tls, 'buf', None)
+        if buf is None:
+            buf = self._tls.buf = memoryview(bytearray(COPY_BUFFER_SIZE))
+        return buf
+
+    def _report(self, msg: str):
+        # per-file updates only feed the status label, so dropping some of them is fine
+        now = time.monotonic()
+        with self._emit_lock:
+            if now - self._last_emit < STATUS_INTERVAL:
+                return
+            self._last_emit = now
+        self.on_status(msg)
+
+    def _scan(self, sources: list[str], work: queue.Queue, n_workers: int, result: dict):
+        # one scandir walker per source; paths stay in the tables until a file is copied
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(sources), self.max_threads) or 1) as executor:
+                result['tables'] = list(executor.map(lambda srcp: self._scan_source(srcp, work), sources))
+        except Exception as e:
+            result['error'] = e
+        finally:
+            for _ in range(n_workers):
+                work.put(None)
+            self.on_scanning_finished()
+
+    def _scan_source(self, srcp: str, work: queue.Queue) -> FileTable:
+        base = os.path.basename(srcp)
+        table = FileTable()
+        batch = []
+        for item in walk_files(srcp, self._exclude_re):
+            if self._stop:
+                return table
+            batch.append(item)
+            if len(batch) >= SCAN_BATCH:
+                self._add_included(table, batch, base, work)
+                batch = []
+        self._add_included(table, batch, base, work)
+        return table
+
+    def _add_included(self, table: FileTable, batch: list, base: str, work: queue.Queue):
+        # map/compress run the regex over the whole batch without a Python-level loop
+        keep = map(not_, map(self._exclude_re.match, map(itemgetter(0), batch)))
+        start = len(table)
+        for path, rel_path, st in compress(batch, keep):
+            table.add(path, rel_path, base, st.st_size if st else 0)
+        with self._scan_lock:
+            self._scanned_bytes += sum(table.sizes[start:])
+        # rows are never changed after they are added, so workers can read them while the scan goes on
+        for i in range(start, len(table)):
+            work.put((table, i))
+    
+    def _copy_file(self, src: str, dest: str, key: str, uring_batch: list | None = None):
+        src_file, dest_file = Path(src), Path(dest)
+        if src_file.is_symlink():
+            target = os.readlink(src_file)
+            if dest_file.exists():
+                # existing Symlink
+                if dest_file.is_symlink():
+                    existing_target = os.readlink(dest_file)
+                    if existing_target == target:
+                        self._report(f"Symlink unchanged: {src_file}")
+                        return
+                # exists but wrong destination -> remove
+                try:
+                    if dest_file.is_dir() and not dest_file.is_symlink():
+                        shutil.rmtree(dest_file)
+                        msg = f"Directory deleted: {dest_file}"
+                        logger.info(msg)
+                        self._report(msg)
+                    else:
+                        dest_file.unlink()
+                except Exception as e:
+                    logger.warning(f"Failed to remove existing file for symlink {dest_file}: {e}")
+
+            try:
+                os.symlink(target, dest_file)
+                msg = f"Symlink created: {src_file} -> {target}"
+                logger.info(msg)
+                self._report(msg)
+            except FileExistsError:
+                # If target got created during Process -> ignore
+                self._report(f"Symlink already exists (ignored): {dest_file}")
+            except Exception as e:
+                logger.warning(f"Failed to copy symlink {src_file}: {e}")
+            return
+
+        # Normal Files
+        st = src_file.stat()
+        entry = self.index.get(key)
+        try:
+            dst = dest_file.stat()
+        except FileNotFoundError:
+            dst = None
+        if dst is not None and self.quick_check:
+            # rsync-style quick check: same size and mtime as at the last sync, or as the backup copy.
+            # The index only vouches for the source, the backup copy must still have the right size
+            sig = (st.st_size, st.st_mtime_ns)
+            if dst.st_size == st.st_size and ((entry and entry[:2] == sig) or dst.st_mtime_ns == st.st_mtime_ns):
+                self._report(f"Skipping (unchanged): {src_file.name}")
+                return
+
+        try:
+            delta = fastcdc is not None and st.st_size > DELTA_THRESHOLD
+            if delta and dst is not None:
+                # trust the stored chunk list only while dest is untouched since the last sync,
+                # and never without quick_check, which promises to compare the real contents
+                known = None
+                if self.quick_check and entry and len(entry) > 3 and entry[:2] == (dst.st_size, dst.st_mtime_ns):
+                    known = entry[3]
+                digest, chunks, written = chunk_and_sync(src_file, dest_file, known)
+                apply_stat(dest_file, st, dst.st_mode)
+                self.index.set(key, st.st_size, st.st_mtime_ns, digest, chunks)
+                if not written:
+                    self._report(f"Skipping (identical): {src_file.name}")
+                    return
+                msg = f"Updated {written}/{len(chunks)} chunks: {src_file} -> {dest_file}"
+                logger.info(msg)
+                self._report(msg)
+                return
+
+            # the source is only read up front when a backup copy of the same size may already match it.
+            # New files get their digest from the io_uring copy, or from the comparison on a later sync
+            digest = None
+            if dst is not None and dst.st_size == st.st_size:
+                if self.quick_check and entry and entry[2]:
+                    # only the source is read, the destination is known from the index
+                    digest = file_digest(src_file, self._buffer())
+                    identical = entry[2] == digest
+                else:
+                    h = new_hash()
+                    identical = files_identical(src_file, dest_file, h=h)
+                    if identical:
+                        digest = h.hexdigest()
+                if identical:
+                    self.index.set(key, st.st_size, st.st_mtime_ns, digest)
+                    self._report(f"Skipping (identical): {src_file.name}")
+                    return
+
+            dest_file.parent.mkdir(parents=True, exist_ok=True)
+            dest_mode = dst.st_mode if dst else NEW_FILE_MODE
+            # clones are a single ioctl, so they never go through io_uring; neither do files reporting
+            # size 0, which io_uring would not read (procfs/sysfs)
+            if uring_batch is not None and not self.reflink and 0 < st.st_size <= URING_MAX_SIZE:
+                # small file: the worker copies it with the next io_uring batch
+                uring_batch.append((src_file, dest_file, st, key, digest, dest_mode))
+                return
+            src_fd = os.open(src_file, os.O_RDONLY)
+            try:
+                dst_fd = os.open(dest_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+                try:
+                    copy_fd(src_fd, dst_fd, st.st_size, reflink=self.reflink, buf=self._buffer())
+                finally:
+                    os.close(dst_fd)
+            finally:
+                os.close(src_fd)
+            self._copy_done(src_file, dest_file, st, key, digest, dest_mode)
+        except Exception as e:
+            logger.warning(f"Failed to copy {src_file}: {e}")
+
+    def _copy_done(self, src_file: Path, dest_file: Path, st, key: str, digest: str | None, dest_mode: int | None):
+        apply_stat(dest_file, st, dest_mode)
+        self.index.set(key, st.st_size, st.st_mtime_ns, digest)
+        msg = f"Copied: {src_file} -> {dest_file}"
+        logger.info(msg)
+        self._report(msg)
+
+    def _flush_uring(self, copier: UringCopier, batch: list):
+        try:
+            results = copier.copy_batch([(job[0], job[1], job[2].st_size) for job in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for job, res in zip(batch, results):
+            try:
+                if isinstance(res, Exception):
+                    raise res
+                src_file, dest_file, st, key, digest, dest_mode = job
+                # the copy read the whole file, so its digest comes for free
+                self._copy_done(src_file, dest_file, st, key, digest or res, dest_mode)
+            except Exception as e:
+                logger.warning(f"Failed to copy {job[0]}: {e}")
+        batch.clear()
+
+    def _worker(self, work: queue.Queue, dest_root: str, done: queue.SimpleQueue):
+        # every worker owns its ring, liburing rings must not be shared between threads
+        copier = None
+        if uring_supported():
+            try:
+                copier = UringCopier()
+            except Exception as e:
+                logger.info(f"io_uring unavailable, copying without it: {e}")
+        batch: list | None = [] if copier else None
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                if self._stop:
+                    # keep draining so the scan never blocks on a full queue
+                    continue
+                table, i = item
+                src_file, rel_path, src_base = table.row(i)
+                dest_file = os.path.join(dest_root, src_base, rel_path)
+                key = f"{src_base}/{rel_path}"
+                try:
+                    self._copy_file(src_file, dest_file, key, batch)
+                    done.put((table, i, None))
+                except Exception as e:
+                    done.put((table, i, e))
+                if copier and batch and len(batch) >= URING_BATCH:
+                    self._flush_uring(copier, batch)
+            if copier and batch:
+                self._flush_uring(copier, batch)
+        finally:
+            if copier:
+                copier.close()
+            done.put(None)
+
+    def _remove_deleted(self, srcp: str, dest_root: str, src_keys: set, to_delete: list):
+        # one pass over the backup of the normalised source srcp; scanned files are looked up in src_keys,
+        # only the rest is stat'ed. Folders are removed right away, files are collected as (path, key) into to_delete
+        base = os.path.basename(srcp)
+        if not base:
+            # a filesystem root has no folder of its own in the backup, never walk the whole destination
+            logger.warning(f"Not removing deleted files for {srcp}: source has no folder name")
+            return
+        backup_root = os.path.join(os.path.normpath(dest_root), base)
+        prefix = backup_root + os.sep
+        stack = [backup_root]
+        while stack:
+            top = stack.pop()
+            try:
+                it = os.scandir(top)
+            except OSError:
+                continue
+            with it:
+                entries = list(it)
+            for entry in entries:
+                rel = entry.path[len(prefix):]
+                orig = os.path.join(srcp, rel)
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.isdir(orig):
+                        stack.append(entry.path)
+                        continue
+                    # Folders
+                    try:
+                        if send2trash:
+                            send2trash(entry.path)
+                            msg = f"Deleted folder to trash: {entry.path}"
+                        else:
+                            shutil.rmtree(entry.path)
+                            msg = f"Deleted folder: {entry.path}"
+                        logger.info(msg)
+                        self._report(msg)
+                    except Exception as e:
+                        logger.warning(f"Failed to delete folder {entry.path}: {e}")
+                    continue
+
+                # Files (excluded files still in the source are kept, as before)
+                key = f"{base}/{rel}"
+                if key in src_keys or os.path.lexists(orig):
+                    continue
+                to_delete.append((entry.path, key))
+
+    def _unlink(self, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Failed to delete {path}: {e}")
+            return
+        msg = f"Deleted: {path}"
+        logger.info(msg)
+        self._report(msg)
+
+    def _delete_files(self, dest_root: str, files: list):
+        if not files:
+            return
+        if not send2trash:
+            with ThreadPoolExecutor(max_workers=DELETE_THREADS) as executor:
+                list(executor.map(self._unlink, (path for path, _ in files)))
+            return
+
+        # move everything into one folder next to the backup and trash that folder in one call
+        staging = os.path.join(dest_root, f".pybackup-deleted-{time.strftime('%Y%m%d-%H%M%S')}")
+        moved = []
+        for path, key in files:
+            target = os.path.join(staging, key)
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Failed to delete {path}: {e}")
+                continue
+            moved.append((path, target))
+        if not os.path.exists(staging):
+            return
+        try:
+            send2trash(staging)
+        except Exception as e:
+            # like a folder that cannot be trashed, the files stay in the backup
+            logger.warning(f"Failed to move {staging} to trash, keeping the files: {e}")
+            self._restore_staged(staging, moved)
+            return
+        for path, _ in moved:
+            msg = f"Deleted to trash: {path}"
+            logger.info(msg)
+            self._report(msg)
+
+    def _restore_staged(self, staging: str, moved: list):
+        # put the files back where they were; whatever cannot be moved back stays in staging
+        kept = False
+        for path, target in moved:
+            try:
+                os.rename(target, path)
+            except OSError as e:
+                logger.warning(f"Failed to restore {path} from {target}: {e}")
+                kept = True
+        if kept:
+            logger.warning(f"Files that could not be restored are in {staging}")
+            return
+        # only the now empty folders are left
+        for root, _, _ in os.walk(staging, topdown=False):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+    def sync(self) -> None:
+        if not self.destination:
+            self.on_status('No destination set.')
+            return
+        dest_root = Path(self.destination)
+            
+        self.on_scanning_started()
+        
+        sources = []
+        for src in self.sources:
+            if not os.path.exists(src):
+                logger.warning(f'Source does not exist: {src}')
+                continue
+            sources.append(os.path.abspath(src))
+
+        self.index.load()
+        self._scanned_bytes = 0
+
+        # the scan feeds the copy workers through a bounded queue, so copying starts with the first scanned files
+        n = self.max_threads
+        work: queue.Queue = queue.Queue(maxsize=WORK_QUEUE_SIZE)
+        done: queue.SimpleQueue = queue.SimpleQueue()
+        scan_result: dict = {}
+        scanner = threading.Thread(target=self._scan, args=(sources, work, n, scan_result), daemon=True)
+        scanner.start()
+        workers = [threading.Thread(target=self._worker, args=(work, str(dest_root), done), daemon=True)
+                   for _ in range(n)]
+        for w in workers:
+            w.start()
+
+        copied_bytes = 0
+        last_progress = 0.0
+        running = len(workers)
+        while running:
+            item = done.get()
+            if item is None:
+                running -= 1
+                continue
+            # sizes come from the scan, no second stat per file
+            table, i, err = item
+            if isinstance(err, FileNotFoundError):
+                continue
+            if err:
+                logger.warning(f"Failed to copy {table.row(i)[0]}: {err}")
+                continue
+            copied_bytes += table.sizes[i]
+            now = time.monotonic()
+            if now - last_progress >= STATUS_INTERVAL:
+                last_progress = now
+                # relative to what has been scanned so far while the scan is still running
+                total_bytes = self._scanned_bytes
+                self.on_progress(int(copied_bytes / total_bytes * 100) if total_bytes else 100)
+        scanner.join()
+        if 'error' in scan_result:
+            self.index.save()
+            raise scan_result['error']
+
+        src_keys = set(chain.from_iterable(table.keys() for table in scan_result['tables']))
+        if self._stop:
+            self.on_status('Stopped by user')
+        else:
+            # a stopped scan is incomplete, so the index is only pruned after a full one
+            self.index.prune(src_keys, {os.path.basename(src) for src in sources})
+        self.index.save()
+
+        # Removal of Files and Folders that no longer exist in the Orginal Filesystem
+        to_delete: list[tuple[str, str]] = []
+        for srcp in sources:
+            self._remove_deleted(srcp, str(dest_root), src_keys, to_delete)
+        self._delete_files(str(dest_root), to_delete)
+
+        self.on_status('Sync completed')
+        self.on_progress(100)